@@ -0,0 +1,22 @@
+"""Gunicorn settings for serving the webtop backend API in production
+
+Run with:
+    gunicorn -c gunicorn_conf.py webtop_backend_script:app
+
+The gevent worker monkey-patches the standard library before the app is
+imported, so the docker subprocess calls and upload reads yield to other
+requests instead of blocking the worker.
+"""
+# For cpu_count
+import os
+
+# Same address as the development server in webtop_backend_script.py
+bind = "0.0.0.0:5000"
+
+# Cooperative workers so slow docker calls and uploads don't block each other
+worker_class = "gevent"
+workers = (2 * (os.cpu_count() or 1)) + 1
+worker_connections = 1000
+
+# Large uploads and docker compose down can take a while
+timeout = 120
@@ -1,18 +1,50 @@
-"""Webtop backend API tool for webtop functionality on Theseus"""
+"""Webtop backend API tool for webtop functionality on Theseus
+
+Third-party dependencies are listed in requirements.txt
+"""
 # For API functionality
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+# For pre-encoding static responses
+import json
 # For remove and chmod
 import os
 # For running bash scripts
 import subprocess
 # For final constant warnings
 from typing import Final
+# For removing staging directories
+import shutil
+# For staging streamed uploads
+import tempfile
+# For streaming multipart uploads straight to disk
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.targets import FileTarget, NullTarget
+# For reading the staged YAML through a memory mapping
+import mmap
 # For secure filenames
 from werkzeug.utils import secure_filename
 # For regex pattern matching
 import re
 # For traceback
 import traceback
+# For guarding the status caches across request threads
+import threading
+# For short-lived status caches
+from cachetools import TTLCache, cached
+# For stamping the shared cache epoch file
+import time
+# For caching the Docker client and sanitized filenames
+import functools
+# For talking to the Docker daemon without forking the docker CLI
+import docker
+# For unique trash directory names
+import uuid
+# For parsing docker-compose files, with the libyaml C loader when available
+import yaml
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 app = Flask(__name__)
 
@@ -20,7 +52,40 @@ app = Flask(__name__)
 RUN_FILE: Final[str] = "run.sh"
 SERVER_URL: Final[str] = "http://127.0.0.1:80"
 UPLOAD_DIR = "/opt/webtops/uploads"
+# Development server debugger and reloader, enabled with WEBTOP_DEBUG=1
+DEBUG_MODE: Final[bool] = os.environ.get("WEBTOP_DEBUG", "0") == "1"
+# Bytes read from the request body per parser call
+UPLOAD_CHUNK_SIZE: Final[int] = 1 << 20
+# Highest N accepted for dockerfile-N / resource-N form fields
+MAX_UPLOAD_PARTS: Final[int] = 64
+# Pattern used to sniff user ID and port out of the raw docker-compose bytes in one scan
+METADATA_PATTERN: Final[re.Pattern] = re.compile(
+    rb'container_name:\s*webtop-ubuntu-xfce-(?P<user>\w+)|-\s*(?P<port>\d+):3000'
+)
+# User ID part of a parsed container_name value
+WEBTOP_ID_PATTERN: Final[re.Pattern] = re.compile(r'webtop-ubuntu-xfce-(\w+)', re.ASCII)
+# Container port of the webtop web UI
+WEBTOP_CONTAINER_PORT: Final[str] = "3000"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Cleaned up webtops are renamed here and deleted off the request path
+# Kept inside UPLOAD_DIR so the rename never crosses filesystems
+TRASH_DIR = os.path.join(UPLOAD_DIR, ".trash")
+os.makedirs(TRASH_DIR, exist_ok=True)
+# Deployment script output, kept out of webtop directories so no upload can clash with it
+DEPLOY_LOG_DIR = os.path.join(UPLOAD_DIR, ".logs")
+os.makedirs(DEPLOY_LOG_DIR, exist_ok=True)
+
+# Short-lived caches so bursts of polling don't hit docker on every request
+LIST_CACHE_TTL: Final[float] = 2.0
+STATUS_CACHE_TTL: Final[float] = 1.0
+list_cache = TTLCache(maxsize=1, ttl=LIST_CACHE_TTL)
+status_cache = TTLCache(maxsize=512, ttl=STATUS_CACHE_TTL)
+cache_lock = threading.Lock()
+# Caches are per process, this file's mtime is part of every cache key and is
+# bumped on each state change so all gunicorn workers stop serving old answers
+CACHE_EPOCH_FILE = os.path.join(UPLOAD_DIR, ".cache_epoch")
+# Container states that `docker ps` lists without --all
+ACTIVE_CONTAINER_STATES: Final[tuple] = ("running", "paused", "restarting")
 
 
 # ============================================
@@ -71,61 +136,329 @@ def run_run_sh_file() -> int:
         return 1
 
 
-def extract_user_from_yaml(yaml_file):
+def scan_metadata(yaml_content: bytes | mmap.mmap) -> tuple[str | None, int | None]:
     """
-    Helper function to extract user ID from YAML content
+    Helper function to extract user ID and port from raw YAML content
     Looks for container_name: webtop-ubuntu-xfce-<user>
+    and for a port mapping like "3021:3000"
     """
+    webtop_id = None
+    port = None
     try:
-        yaml_file.seek(0)  # Reset file pointer
-        content = yaml_file.read().decode('utf-8')
-        yaml_file.seek(0)  # Reset again for saving
-
-        match = re.search(r'container_name:\s*webtop-ubuntu-xfce-(\w+)', content)
-        if match:
-            return match.group(1)
+        # Single pass over the content, stop once both values are found
+        for match in METADATA_PATTERN.finditer(yaml_content):
+            if match.lastgroup == "user":
+                if webtop_id is None:
+                    webtop_id = match.group("user").decode()
+            elif port is None:
+                port = int(match.group("port"))
+
+            if webtop_id is not None and port is not None:
+                break
     except Exception as e:
-        print(f"Error extracting user from YAML: {e}")
+        print(f"Error extracting metadata from YAML: {e}")
+    return webtop_id, port
+
+
+def find_published_port(ports: list) -> int | None:
+    """
+    Helper function to find the host port mapped to the webtop container port
+    Handles short ("3021:3000", "127.0.0.1:3021:3000/tcp") and long
+    ({target: 3000, published: 3021}) compose port syntax
+    """
+    for mapping in ports:
+        if isinstance(mapping, dict):
+            published = str(mapping.get("published", ""))
+            if str(mapping.get("target")) != WEBTOP_CONTAINER_PORT:
+                continue
+        else:
+            host, _, container = str(mapping).rpartition(":")
+            if container.split("/")[0] != WEBTOP_CONTAINER_PORT:
+                continue
+            published = host.rpartition(":")[2]
+        if published.isdigit():
+            return int(published)
     return None
 
 
-def extract_port_from_yaml(yaml_file):
+def extract_metadata(yaml_content: bytes | mmap.mmap) -> tuple[str | None, int | None]:
     """
-    Helper function to extract port from YAML content
-    Looks for port mapping like "3021:3000"
+    Helper function to extract user ID and port from docker-compose content
+    Reads container_name (webtop-ubuntu-xfce-<user>) and the port mapped to
+    3000 from the services, falls back to scan_metadata on invalid YAML
     """
     try:
-        yaml_file.seek(0)  # Reset file pointer
-        content = yaml_file.read().decode('utf-8')
-        yaml_file.seek(0)  # Reset again for saving
+        document = yaml.load(yaml_content, Loader=YamlLoader)
+    # Constructor errors (e.g. "!!int abc") are ValueError/TypeError, not YAMLError
+    except (yaml.YAMLError, ValueError, TypeError, RecursionError) as e:
+        print(f"Warning: Could not parse YAML, scanning it instead: {e}")
+        return scan_metadata(yaml_content)
 
-        match = re.search(r'-\s*(\d+):3000', content)
-        if match:
-            return int(match.group(1))
+    webtop_id = None
+    port = None
+    try:
+        services = document.get("services") if isinstance(document, dict) else None
+        for service in (services or {}).values():
+            if not isinstance(service, dict):
+                continue
+
+            if webtop_id is None:
+                match = WEBTOP_ID_PATTERN.match(str(service.get("container_name", "")))
+                if match:
+                    webtop_id = match.group(1)
+
+            if port is None:
+                port = find_published_port(service.get("ports") or [])
     except Exception as e:
-        print(f"Error extracting port from YAML: {e}")
+        print(f"Error extracting metadata from YAML: {e}")
+    return webtop_id, port
+
+
+def extract_metadata_from_file(yaml_path: str) -> tuple[str | None, int | None]:
+    """
+    Helper function to extract user ID and port from a docker-compose file
+    The file is memory-mapped: the regex fallback scans the mapping in place,
+    the YAML loaders still copy it out chunk by chunk through mmap.read()
+    """
+    with open(yaml_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as yaml_content:
+            return extract_metadata(yaml_content)
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_secure_filename(filename: str) -> str:
+    """secure_filename memoized, uploads repeat the same names across deploys."""
+    return secure_filename(filename)
+
+
+class UnsupportedUploadError(Exception):
+    """Raised when the request holds a dockerfile-*/resource-* part we can't store."""
+
+
+class RejectUploadTarget(NullTarget):
+    """Target for unregistered dockerfile-*/resource-* parts, aborts the parse."""
+
+    def on_start(self):
+        raise UnsupportedUploadError(
+            f"Unsupported upload field: only dockerfile-1..dockerfile-{MAX_UPLOAD_PARTS} "
+            f"and resource-1..resource-{MAX_UPLOAD_PARTS} are accepted"
+        )
+
+
+def stream_multipart_upload(staging_dir: str) -> dict:
+    """
+    Helper function to stream the multipart request body without buffering it
+    docker-compose, dockerfile-N and resource-N parts are written into staging_dir
+    Returns a dict of received form keys to file targets
+    Raises UnsupportedUploadError for any other dockerfile-*/resource-* part
+    """
+    parser = StreamingFormDataParser(headers=request.headers)
+
+    keys = ["docker-compose"]
+    for prefix in ("dockerfile", "resource"):
+        keys += [f"{prefix}-{i}" for i in range(1, MAX_UPLOAD_PARTS + 1)]
+
+    file_targets = {}
+    for key in keys:
+        file_targets[key] = FileTarget(os.path.join(staging_dir, key))
+        parser.register(key, file_targets[key])
+
+    # Registered last so it only sees names none of the slots above matched
+    parser.register(
+        "unsupported-upload",
+        RejectUploadTarget(),
+        matches=lambda _, name: name.startswith(("dockerfile-", "resource-"))
+    )
+
+    for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b""):
+        parser.data_received(chunk)
+
+    # FileTarget only creates its file once the part shows up in the body
+    received = {key: target for key, target in file_targets.items()
+                if os.path.exists(target.filename)}
+    return received
+
+
+@functools.lru_cache(maxsize=1)
+def get_docker_client() -> docker.DockerClient:
+    """Create the Docker client on first use and keep its socket connection."""
+    return docker.from_env()
+
+
+def format_port_bindings(ports: dict) -> str:
+    """
+    Helper function to render container port bindings like `docker port`
+    e.g. "3000/tcp -> 0.0.0.0:3021"
+    """
+    lines = []
+    for container_port, bindings in ports.items():
+        for binding in bindings or []:
+            host_ip = binding["HostIp"]
+            if ":" in host_ip:
+                host_ip = f"[{host_ip}]"
+            lines.append(f"{container_port} -> {host_ip}:{binding['HostPort']}")
+    return "\n".join(lines)
+
+
+def get_cache_epoch() -> int:
+    """Return the shared cache epoch, see CACHE_EPOCH_FILE."""
+    try:
+        return os.stat(CACHE_EPOCH_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+@cached(status_cache, lock=cache_lock)
+def get_webtop_status(webtop_id: str, cache_epoch: int) -> dict:
+    """
+    Helper function to get the container status of a webtop
+    Results are cached for STATUS_CACHE_TTL seconds per webtop and cache_epoch
+    """
+    container_name = f"webtop-ubuntu-xfce-{webtop_id}"
+
+    # Check if container is running
+    # Daemon errors read as "not running", like a failed `docker ps` did
+    try:
+        container = get_docker_client().containers.get(container_name)
+    except docker.errors.NotFound:
+        container = None
+    except docker.errors.DockerException as e:
+        print(f"Error querying Docker for {container_name}: {e}")
+        container = None
+
+    if container is None or container.status not in ACTIVE_CONTAINER_STATES:
+        return {
+            "status": "not_running",
+            "webtop_id": webtop_id,
+            "message": "Container not found or stopped"
+        }
+
+    return {
+        "status": "running",
+        "container": container.name,
+        "container_status": container.status,
+        "webtop_id": webtop_id,
+        "ports": format_port_bindings(container.ports)
+    }
+
+
+@cached(list_cache, lock=cache_lock)
+def get_webtop_list(cache_epoch: int) -> list:
+    """
+    Helper function to list deployed webtops and whether their container runs
+    Results are cached for LIST_CACHE_TTL seconds per cache_epoch
+    """
+    webtops = []
+
+    if not os.path.exists(UPLOAD_DIR):
+        return webtops
+
+    # Get all running container names with a single docker call
+    # Daemon errors list every webtop as not running, like a failed `docker ps` did
+    try:
+        running_containers = {
+            name.lstrip("/")
+            for container in get_docker_client().containers.list(sparse=True)
+            for name in container.attrs["Names"]
+        }
+    except docker.errors.DockerException as e:
+        print(f"Error listing Docker containers: {e}")
+        running_containers = set()
+
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith("webtop_") and entry.is_dir():
+                webtop_id = entry.name.replace("webtop_", "")
+
+                # Check if container is running
+                is_running = f"webtop-ubuntu-xfce-{webtop_id}" in running_containers
+
+                webtops.append({
+                    "webtop_id": webtop_id,
+                    "directory": entry.path,
+                    "is_running": is_running,
+                    "container_name": f"webtop-ubuntu-xfce-{webtop_id}" if is_running else None
+                })
+
+    return webtops
+
+
+def find_compose_file(webtop_dir: str) -> str | None:
+    """
+    Helper function to find the docker-compose YAML file of a webtop
+    Returns the path of the first .yaml/.yml file in webtop_dir, or None
+    """
+    with os.scandir(webtop_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(('.yaml', '.yml')) and entry.is_file():
+                return entry.path
     return None
 
 
+def get_deploy_log_path(webtop_id: str) -> str:
+    """Return the deployment log file of a webtop, see DEPLOY_LOG_DIR."""
+    return os.path.join(DEPLOY_LOG_DIR, f"webtop_{webtop_id}.log")
+
+
+def invalidate_webtop_cache() -> None:
+    """Bump the shared cache epoch after a webtop changed state."""
+    now = time.time_ns()
+    with open(CACHE_EPOCH_FILE, "a"):
+        pass
+    os.utime(CACHE_EPOCH_FILE, ns=(now, now))
+
+
+def remove_in_background(paths: list) -> None:
+    """
+    Helper function to delete paths with `rm -rf` in a child process
+    A separate process keeps the deletion off this worker, gevent can't
+    preempt a shutil.rmtree running in a greenlet
+    """
+    if paths:
+        subprocess.Popen(
+            ["rm", "-rf", "--", *paths],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+
+def empty_trash() -> None:
+    """Delete whatever earlier processes left in TRASH_DIR."""
+    with os.scandir(TRASH_DIR) as entries:
+        remove_in_background([entry.path for entry in entries])
+
+
+# Finish deletions a previous process didn't get to
+empty_trash()
+
+
 # ============================================
 # API ENDPOINTS
 # ============================================
 
+# Health check body never changes, encode it once
+INDEX_BODY: Final[bytes] = (json.dumps({
+    "status": "ok",
+    "message": "Webtop API is active",
+    "version": "1.0.0",
+    "endpoints": {
+        "GET /": "Health check",
+        "POST /deploy": "Deploy a new webtop instance",
+        "GET /deploy/status/<webtop_id>": "Check webtop status",
+        "POST /deploy/stop/<webtop_id>": "Stop a webtop instance",
+        "DELETE /deploy/cleanup/<webtop_id>": "Cleanup webtop files"
+    }
+}, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
 @app.route("/", methods=["GET"])
 def index():
     """Simple health check."""
-    return jsonify({
-        "status": "ok",
-        "message": "Webtop API is active",
-        "version": "1.0.0",
-        "endpoints": {
-            "GET /": "Health check",
-            "POST /deploy": "Deploy a new webtop instance",
-            "GET /deploy/status/<webtop_id>": "Check webtop status",
-            "POST /deploy/stop/<webtop_id>": "Stop a webtop instance",
-            "DELETE /deploy/cleanup/<webtop_id>": "Cleanup webtop files"
-        }
-    }), 200
+    return Response(INDEX_BODY, mimetype="application/json"), 200
 
 
 @app.route("/deploy", methods=["POST"])
@@ -139,31 +472,38 @@ def deploy_webtop():
     """
     webtop_id = None
     webtop_dir = None
+    staging_dir = None
 
     try:
-        # Extract all files from the request
-        files = request.files
-
-        if not files:
+        if request.mimetype != "multipart/form-data":
             return jsonify({
                 "status": "error",
                 "message": "No files received"
             }), 400
 
+        # Stream all files from the request
+        staging_dir = tempfile.mkdtemp(prefix=".staging_", dir=UPLOAD_DIR)
+        try:
+            files = stream_multipart_upload(staging_dir)
+        except UnsupportedUploadError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 400
+
         # === Extract docker-compose YAML ===
-        yaml_file = files.get("docker-compose")
-        if not yaml_file:
+        yaml_upload = files.pop("docker-compose", None)
+        if not yaml_upload or not os.path.getsize(yaml_upload.filename):
             return jsonify({
                 "status": "error",
                 "message": "Missing docker-compose file"
             }), 400
 
         # Parse the YAML filename
-        yaml_filename = secure_filename(yaml_file.filename or "docker-compose.yaml")
+        yaml_filename = cached_secure_filename(yaml_upload.multipart_filename or "docker-compose.yaml")
 
-        # Extract user ID and port from YAML content
-        webtop_id = extract_user_from_yaml(yaml_file)
-        port = extract_port_from_yaml(yaml_file)
+        # Extract user ID and port from the staged YAML file
+        webtop_id, port = extract_metadata_from_file(yaml_upload.filename)
 
         if not webtop_id:
             webtop_id = "default_user"
@@ -176,7 +516,7 @@ def deploy_webtop():
 
         # === Save docker-compose YAML ===
         yaml_path = os.path.join(webtop_dir, yaml_filename)
-        yaml_file.save(yaml_path)
+        os.replace(yaml_upload.filename, yaml_path)
         print(f"Saved YAML file: {yaml_path}")
 
         saved_files = {
@@ -185,74 +525,86 @@ def deploy_webtop():
             "resources": []
         }
 
-        # === Save all Dockerfiles ===
-        # Java sends as: dockerfile-1, dockerfile-2, etc.
-        dockerfile_count = 0
-        for key in sorted(files.keys()):
-            if key.startswith("dockerfile-"):
-                dockerfile = files[key]
-                dockerfile_name = secure_filename(dockerfile.filename or f"Dockerfile.{dockerfile_count + 1}")
-                dockerfile_path = os.path.join(webtop_dir, dockerfile_name)
-                dockerfile.save(dockerfile_path)
-                saved_files["dockerfiles"].append(dockerfile_name)
-                dockerfile_count += 1
-                print(f"Saved Dockerfile: {dockerfile_name}")
-
-        # === Save all Resources ===
-        # Java sends as: resource-1, resource-2, etc.
-        resource_count = 0
+        # === Save all Dockerfiles and Resources ===
+        # Java sends as: dockerfile-1, dockerfile-2, ..., resource-1, resource-2, etc.
+        # Parts are already on disk in the staging directory, only move them
+        # Form key prefix -> (saved_files list, default name, log label)
+        upload_kinds = {
+            "dockerfile": ("dockerfiles", "Dockerfile.{}", "Dockerfile"),
+            "resource": ("resources", "resource_{}", "resource"),
+        }
         for key in sorted(files.keys()):
-            if key.startswith("resource-"):
-                resource = files[key]
-                resource_name = secure_filename(resource.filename or f"resource_{resource_count + 1}")
-                resource_path = os.path.join(webtop_dir, resource_name)
-                resource.save(resource_path)
-                saved_files["resources"].append(resource_name)
-                resource_count += 1
-                print(f"Saved resource: {resource_name}")
+            kind, _, _ = key.partition("-")
+            saved_key, default_name, label = upload_kinds[kind]
+            upload = files[key]
+            file_name = cached_secure_filename(upload.multipart_filename or default_name.format(len(saved_files[saved_key]) + 1))
+            os.replace(upload.filename, os.path.join(webtop_dir, file_name))
+            saved_files[saved_key].append(file_name)
+            print(f"Saved {label}: {file_name}")
 
         # === Create run.sh script ===
         run_sh_path = os.path.join(webtop_dir, "run.sh")
+        script_lines = [
+            "#!/bin/bash",
+            f"# Webtop deployment script for user: {webtop_id}",
+            "# Generated automatically by Webtop API",
+            "",
+            f"cd {webtop_dir}",
+            "",
+            "# Use BuildKit so rebuilds reuse cached layers",
+            "export DOCKER_BUILDKIT=1",
+            "",
+        ]
+
+        # Build Dockerfiles if present
+        if saved_files["dockerfiles"]:
+            script_lines.append("# Build custom Docker images")
+            for i, dockerfile in enumerate(saved_files["dockerfiles"], 1):
+                image_tag = f"webtop-custom-{webtop_id}-{i}"
+                script_lines += [
+                    f"echo 'Building Docker image: {image_tag}'",
+                    f"docker build --build-arg BUILDKIT_INLINE_CACHE=1 --cache-from {image_tag} -f {dockerfile} -t {image_tag} .",
+                    "if [ $? -ne 0 ]; then",
+                    f"    echo 'Error: Failed to build {image_tag}'",
+                    "    exit 1",
+                    "fi",
+                    "",
+                ]
+
+        # Launch docker compose
+        script_lines += [
+            "# Launch Docker Compose",
+            f"echo 'Starting Docker Compose with {yaml_filename}'",
+            f"docker compose -f {yaml_filename} up -d",
+            "if [ $? -eq 0 ]; then",
+            f"    echo 'Webtop deployment successful for user: {webtop_id}'",
+            "else",
+            "    echo 'Error: Docker Compose failed'",
+            "    exit 1",
+            "fi",
+        ]
+
         with open(run_sh_path, "w", encoding="utf-8") as f:
-            f.write("#!/bin/bash\n")
-            f.write(f"# Webtop deployment script for user: {webtop_id}\n")
-            f.write(f"# Generated automatically by Webtop API\n\n")
-            f.write(f"cd {webtop_dir}\n\n")
-
-            # Build Dockerfiles if present
-            if saved_files["dockerfiles"]:
-                f.write("# Build custom Docker images\n")
-                for i, dockerfile in enumerate(saved_files["dockerfiles"], 1):
-                    image_tag = f"webtop-custom-{webtop_id}-{i}"
-                    f.write(f"echo 'Building Docker image: {image_tag}'\n")
-                    f.write(f"docker build -f {dockerfile} -t {image_tag} .\n")
-                    f.write(f"if [ $? -ne 0 ]; then\n")
-                    f.write(f"    echo 'Error: Failed to build {image_tag}'\n")
-                    f.write(f"    exit 1\n")
-                    f.write(f"fi\n\n")
-
-            # Launch docker compose
-            f.write("# Launch Docker Compose\n")
-            f.write(f"echo 'Starting Docker Compose with {yaml_filename}'\n")
-            f.write(f"docker compose -f {yaml_filename} up -d\n")
-            f.write(f"if [ $? -eq 0 ]; then\n")
-            f.write(f"    echo 'Webtop deployment successful for user: {webtop_id}'\n")
-            f.write(f"else\n")
-            f.write(f"    echo 'Error: Docker Compose failed'\n")
-            f.write(f"    exit 1\n")
-            f.write(f"fi\n")
+            f.write("\n".join(script_lines) + "\n")
 
         os.chmod(run_sh_path, 0o755)
         print(f"Created run.sh script: {run_sh_path}")
 
         # === Execute deployment asynchronously ===
         print(f"Launching deployment for user: {webtop_id}")
-        process = subprocess.Popen(
-            ["bash", run_sh_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=webtop_dir
-        )
+        # Output goes to a log file: pipes nobody reads would stall the build once full
+        deploy_log_path = get_deploy_log_path(webtop_id)
+        # Append, an earlier run.sh for this webtop may still be writing to it
+        with open(deploy_log_path, "ab") as deploy_log:
+            process = subprocess.Popen(
+                ["bash", run_sh_path],
+                stdin=subprocess.DEVNULL,
+                stdout=deploy_log,
+                stderr=subprocess.STDOUT,
+                cwd=webtop_dir,
+                start_new_session=True
+            )
+        invalidate_webtop_cache()
 
         # Prepare response
         response_data = {
@@ -280,6 +632,10 @@ def deploy_webtop():
             "traceback": error_trace
         }), 500
 
+    finally:
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
 
 @app.route("/deploy/status/<webtop_id>", methods=["GET"])
 def check_webtop_status(webtop_id):
@@ -287,44 +643,7 @@ def check_webtop_status(webtop_id):
     Check if a webtop deployment is running
     """
     try:
-        # Check if container is running
-        result = subprocess.run(
-            ["docker", "ps", "--filter", f"name=webtop-ubuntu-xfce-{webtop_id}", "--format", "{{.Names}}"],
-            capture_output=True,
-            text=True
-        )
-
-        container_name = result.stdout.strip()
-
-        if container_name:
-            # Get additional container info
-            inspect_result = subprocess.run(
-                ["docker", "inspect", container_name, "--format", "{{.State.Status}}"],
-                capture_output=True,
-                text=True
-            )
-            container_status = inspect_result.stdout.strip()
-
-            # Get port mapping
-            port_result = subprocess.run(
-                ["docker", "port", container_name],
-                capture_output=True,
-                text=True
-            )
-
-            return jsonify({
-                "status": "running",
-                "container": container_name,
-                "container_status": container_status,
-                "webtop_id": webtop_id,
-                "ports": port_result.stdout.strip()
-            }), 200
-        else:
-            return jsonify({
-                "status": "not_running",
-                "webtop_id": webtop_id,
-                "message": "Container not found or stopped"
-            }), 200
+        return jsonify(get_webtop_status(webtop_id, get_cache_epoch())), 200
 
     except Exception as e:
         return jsonify({
@@ -341,19 +660,17 @@ def stop_webtop(webtop_id):
     """
     try:
         webtop_dir = os.path.join(UPLOAD_DIR, f"webtop_{webtop_id}")
-        yaml_path = os.path.join(webtop_dir, "docker-compose.yaml")
 
-        if not os.path.exists(webtop_dir):
+        # Try to find any yaml file in the directory
+        try:
+            yaml_path = find_compose_file(webtop_dir)
+        except (FileNotFoundError, NotADirectoryError):
             return jsonify({
                 "status": "error",
                 "message": f"Webtop directory not found: {webtop_id}"
             }), 404
 
-        # Try to find any yaml file in the directory
-        yaml_files = [f for f in os.listdir(webtop_dir) if f.endswith(('.yaml', '.yml'))]
-        if yaml_files:
-            yaml_path = os.path.join(webtop_dir, yaml_files[0])
-        else:
+        if not yaml_path:
             return jsonify({
                 "status": "error",
                 "message": f"No YAML file found in webtop directory: {webtop_id}"
@@ -363,23 +680,24 @@ def stop_webtop(webtop_id):
 
         result = subprocess.run(
             ["docker", "compose", "-f", yaml_path, "down"],
-            capture_output=True,
-            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             cwd=webtop_dir
         )
+        invalidate_webtop_cache()
 
         if result.returncode == 0:
             return jsonify({
                 "status": "success",
                 "message": f"Webtop stopped: {webtop_id}",
-                "output": result.stdout,
+                "output": result.stdout.decode(errors="replace"),
                 "webtop_dir": webtop_dir
             }), 200
         else:
             return jsonify({
                 "status": "error",
                 "message": "Failed to stop webtop",
-                "error": result.stderr,
+                "error": result.stderr.decode(errors="replace"),
                 "webtop_id": webtop_id
             }), 500
 
@@ -399,26 +717,33 @@ def cleanup_webtop(webtop_id):
     try:
         webtop_dir = os.path.join(UPLOAD_DIR, f"webtop_{webtop_id}")
 
-        if not os.path.exists(webtop_dir):
+        try:
+            yaml_path = find_compose_file(webtop_dir)
+        except (FileNotFoundError, NotADirectoryError):
             return jsonify({
                 "status": "error",
                 "message": f"Webtop directory not found: {webtop_id}"
             }), 404
 
         # First, try to stop the container
-        yaml_files = [f for f in os.listdir(webtop_dir) if f.endswith(('.yaml', '.yml'))]
-        if yaml_files:
-            yaml_path = os.path.join(webtop_dir, yaml_files[0])
+        if yaml_path:
             subprocess.run(
                 ["docker", "compose", "-f", yaml_path, "down"],
-                capture_output=True,
-                text=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 cwd=webtop_dir
             )
 
-        # Remove the directory and all its contents
-        import shutil
-        shutil.rmtree(webtop_dir)
+        # Move the directory out of the way and remove its contents in the background
+        trash_path = os.path.join(TRASH_DIR, f"{webtop_id}-{uuid.uuid4().hex}")
+        os.rename(webtop_dir, trash_path)
+        # Move the log into the trash too, deleting it by path later could hit the next deploy's log
+        try:
+            os.replace(get_deploy_log_path(webtop_id), os.path.join(trash_path, "deploy.log"))
+        except FileNotFoundError:
+            pass
+        remove_in_background([trash_path])
+        invalidate_webtop_cache()
 
         return jsonify({
             "status": "success",
@@ -440,35 +765,7 @@ def list_webtops():
     List all deployed webtops
     """
     try:
-        webtops = []
-
-        if not os.path.exists(UPLOAD_DIR):
-            return jsonify({
-                "status": "success",
-                "webtops": [],
-                "count": 0
-            }), 200
-
-        for dir_name in os.listdir(UPLOAD_DIR):
-            if dir_name.startswith("webtop_"):
-                webtop_id = dir_name.replace("webtop_", "")
-                webtop_dir = os.path.join(UPLOAD_DIR, dir_name)
-
-                # Check if container is running
-                result = subprocess.run(
-                    ["docker", "ps", "--filter", f"name=webtop-ubuntu-xfce-{webtop_id}", "--format", "{{.Names}}"],
-                    capture_output=True,
-                    text=True
-                )
-
-                is_running = bool(result.stdout.strip())
-
-                webtops.append({
-                    "webtop_id": webtop_id,
-                    "directory": webtop_dir,
-                    "is_running": is_running,
-                    "container_name": f"webtop-ubuntu-xfce-{webtop_id}" if is_running else None
-                })
+        webtops = get_webtop_list(get_cache_epoch())
 
         return jsonify({
             "status": "success",
@@ -486,6 +783,8 @@ def list_webtops():
 # ============================================
 # MAIN
 # ============================================
+# Development server only, in production run under gunicorn with gevent workers:
+#     gunicorn -c gunicorn_conf.py webtop_backend_script:app
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -494,10 +793,14 @@ if __name__ == "__main__":
     print(f"Upload Directory: {UPLOAD_DIR}")
     print(f"Server URL: {SERVER_URL}")
     print(f"Listening on: http://0.0.0.0:5000")
+    print(f"Debug mode: {DEBUG_MODE}")
     print("=" * 60)
 
-    # Ensure upload directory exists
+    # Ensure upload, trash and log directories exist
     os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(TRASH_DIR, exist_ok=True)
+    os.makedirs(DEPLOY_LOG_DIR, exist_ok=True)
 
     # Run the app on all interfaces so other computers can connect
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    # Debugger and reloader only when WEBTOP_DEBUG=1, the reloader stats every module each second
+    app.run(host="0.0.0.0", port=5000, debug=DEBUG_MODE, use_reloader=DEBUG_MODE)
\ No newline at end of file